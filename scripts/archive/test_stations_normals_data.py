@@ -1,3 +1,4 @@
+import sys
 import json
 import requests
 from pathlib import Path
@@ -9,9 +10,9 @@ Test those that do and output clean stations jsons for collection
 
 # Determine the absolute paths for input and output files
 BASE = Path(__file__).resolve().parent
-STATIONS_ALL = BASE / "../data/reference/socal_stations.json"
-STATIONS_HOURLY = BASE / "../data/reference/socal_stations_hourly.json"
-STATIONS_DAILY = BASE / "../data/reference/socal_stations_daily.json"
+STATIONS_ALL = BASE / "../../data/reference/socal_stations.json"
+STATIONS_HOURLY = BASE / "../../data/reference/socal_stations_hourly.json"
+STATIONS_DAILY = BASE / "../../data/reference/socal_stations_daily.json"
 
 # Base URLs for hourly and daily data
 base_urls = {
@@ -20,15 +21,24 @@ base_urls = {
 }
 
 # Function to test whether stations have data
+# Returns None when the answer isn't a definite 200 or 404 (errors, 429s, 503s)
 def test_station_url(station_id, url_template):
     url = url_template.format(station_id)
-    response = requests.head(url)
-    return response.status_code == 200
+    try:
+        response = requests.head(url, timeout=30)
+    except requests.RequestException:
+        return None
+    if response.status_code == 200:
+        return True
+    if response.status_code == 404:
+        return False
+    return None
 
 # Load station data from the JSON file
 with open(STATIONS_ALL, "r") as f:
     stations = json.load(f)
 
+unknown_stations = []
 working_stations = {
     "hourly": {},
     "daily": {}
@@ -37,12 +47,20 @@ working_stations = {
 # Test stations for hourly and daily data
 for station_id, details in stations.items():
     for frequency, base_url in base_urls.items():
-        if test_station_url(station_id, base_url):
+        has_data = test_station_url(station_id, base_url)
+        if has_data is None:
+            unknown_stations.append((station_id, frequency))
+            print(f"Station number {station_id} couldn't be checked for {frequency} normals data")
+        elif has_data:
             working_stations[frequency][station_id] = details
             print(f"Station number {station_id} has {frequency} normals data!")
         else:
             print(f"Station number {station_id} doesn't have {frequency} normals data!")
 
+# Don't drop stations over transient errors: keep the existing files instead
+if unknown_stations:
+    sys.exit(f"{len(unknown_stations)} station checks failed; reference files left unchanged")
+
 # Export the working stations to new JSON files
 with open(STATIONS_HOURLY, "w") as f:
     json.dump(working_stations["hourly"], f, indent=4)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# NDFD apparent temperature at LA-area points
+# Requests only the LA-basin window of the nowCOAST CONUS apparent temperature
+# WMS layer, caches the image on disk keyed by layer, valid time and bbox,
+# and samples the grid at every station and location in one vectorized gather.
+# Set WMS_URL to point at a local WMS stub for testing.
+
+import io
+import os
+import json
+import math
+import shutil
+import boto3
+import requests
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from PIL import Image
+from xml.etree import ElementTree as ET
+
+# Determine the absolute paths for input and output files
+BASE = Path(__file__).resolve().parent
+STATIONS = BASE / "../data/reference/socal_stations_daily.json"
+LOCATIONS = BASE / "../data/reference/locations.json"
+CACHE_DIR = BASE / "../data/cache/wms"
+JSON_OUT = BASE / "../data/processed/apparent_temperature_points.json"
+CSV_OUT = BASE / "../data/processed/apparent_temperature_points.csv"
+
+WMS_URL = os.getenv(
+    "WMS_URL", "https://nowcoast.noaa.gov/geoserver/forecasts/ndfd_temperature/ows"
+)
+LAYER = "conus_apparent_temperature"
+
+# NDFD grids are 2.5 km, roughly 0.025 degrees at LA's latitude
+GRID_STEP = 0.025
+
+# Padding around the outermost points, in degrees
+PADDING = 0.1
+
+WMS_NS = {"wms": "http://www.opengis.net/wms"}
+
+
+def load_points():
+    """Stations and locations as one DataFrame of names, kinds and coordinates."""
+    with open(STATIONS, "r") as f:
+        stations = json.load(f)
+    with open(LOCATIONS, "r") as f:
+        locations = json.load(f)
+
+    points = [
+        {"name": info["station"].title(), "kind": "station", "id": station_id,
+         "latitude": info["latitude"], "longitude": info["longitude"]}
+        for station_id, info in stations.items()
+    ] + [
+        {"name": name, "kind": "location", "id": None,
+         "latitude": info["latitude"], "longitude": info["longitude"]}
+        for name, info in locations.items()
+    ]
+    return pd.DataFrame(points)
+
+
+def points_bbox(lats, lons):
+    """Bounding box (min lon, min lat, max lon, max lat) snapped out to the grid step."""
+    def snap_down(value):
+        return round(math.floor((value - PADDING) / GRID_STEP) * GRID_STEP, 4)
+
+    def snap_up(value):
+        return round(math.ceil((value + PADDING) / GRID_STEP) * GRID_STEP, 4)
+
+    return (snap_down(lons.min()), snap_down(lats.min()), snap_up(lons.max()), snap_up(lats.max()))
+
+
+def fetch_valid_time(layer):
+    """Default valid time advertised for the layer in GetCapabilities."""
+    params = {"SERVICE": "WMS", "VERSION": "1.3.0", "REQUEST": "GetCapabilities"}
+    response = requests.get(WMS_URL, params=params)
+    response.raise_for_status()
+    root = ET.fromstring(response.content)
+
+    layer_element = root.find(f".//wms:Layer[wms:Name='{layer}']", WMS_NS)
+    if layer_element is None:
+        raise ValueError(f"Layer {layer} not found in capabilities")
+    dimension = layer_element.find(".//wms:Dimension[@name='time']", WMS_NS)
+    if dimension is None:
+        raise ValueError(f"Layer {layer} has no time dimension")
+    if dimension.attrib.get("default"):
+        return dimension.attrib["default"]
+    return dimension.text.split(",")[0].split("/")[0].strip()
+
+
+def cache_dir(layer, valid_time):
+    return CACHE_DIR / layer / valid_time.replace(":", "").replace("-", "")
+
+
+def fetch_cached(path, params, content_type):
+    """Return the cached response body at path, fetching it from the WMS if missing."""
+    if path.exists():
+        return path.read_bytes()
+    response = requests.get(WMS_URL, params=params)
+    response.raise_for_status()
+
+    # WMS errors come back as ServiceExceptionReport XML with a 200 status
+    received = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if received != content_type:
+        raise ValueError(
+            f"Expected {content_type} from {params['REQUEST']}, got {received}: {response.text[:200]}"
+        )
+
+    # Write to a temporary file first so an interrupted run can't cache a partial body
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(response.content)
+    temp_path.replace(path)
+    return response.content
+
+
+def prune_cache(layer, valid_time):
+    """Remove cached valid times older than the current one."""
+    current = cache_dir(layer, valid_time)
+    for path in (CACHE_DIR / layer).iterdir():
+        if path.is_dir() and path.name < current.name:
+            shutil.rmtree(path)
+
+
+def fetch_tile(layer, valid_time, bbox):
+    """RGBA array for the bbox window at the NDFD grid resolution."""
+    width = max(1, round((bbox[2] - bbox[0]) / GRID_STEP))
+    height = max(1, round((bbox[3] - bbox[1]) / GRID_STEP))
+    params = {
+        "SERVICE": "WMS",
+        "VERSION": "1.3.0",
+        "REQUEST": "GetMap",
+        "LAYERS": layer,
+        "STYLES": "",
+        # CRS:84 keeps the bbox in lon/lat order under WMS 1.3.0
+        "CRS": "CRS:84",
+        "BBOX": ",".join(str(value) for value in bbox),
+        "WIDTH": width,
+        "HEIGHT": height,
+        "FORMAT": "image/png",
+        "TRANSPARENT": "TRUE",
+        "TIME": valid_time,
+    }
+    bbox_key = "_".join(f"{value:.4f}" for value in bbox)
+    path = cache_dir(layer, valid_time) / f"{bbox_key}_{width}x{height}.png"
+    content = fetch_cached(path, params, "image/png")
+    return np.asarray(Image.open(io.BytesIO(content)).convert("RGBA"))
+
+
+def fetch_colormap(layer, valid_time):
+    """
+    Legend color stops as (colors, quantities) arrays, ordered by quantity,
+    plus the colormap type ("ramp", "intervals" or "values"). Transparent
+    no-data stops are dropped.
+    """
+    params = {
+        "SERVICE": "WMS",
+        "VERSION": "1.3.0",
+        "REQUEST": "GetLegendGraphic",
+        "LAYER": layer,
+        "FORMAT": "application/json",
+    }
+    content = fetch_cached(cache_dir(layer, valid_time) / "legend.json", params, "application/json")
+    legend = json.loads(content)
+
+    entries = []
+    colormap_type = "ramp"
+    for layer_legend in legend["Legend"]:
+        for rule in layer_legend.get("rules", []):
+            for symbolizer in rule.get("symbolizers", []):
+                colormap = symbolizer.get("Raster", {}).get("colormap", {})
+                entries.extend(colormap.get("entries", []))
+                colormap_type = colormap.get("type", colormap_type)
+
+    entries = [entry for entry in entries if float(entry.get("opacity", 1)) > 0]
+    if not entries:
+        raise ValueError(f"No colormap entries in legend for {layer}")
+
+    entries = sorted(entries, key=lambda entry: float(entry["quantity"]))
+    colors = np.array(
+        [[int(entry["color"][i:i + 2], 16) for i in (1, 3, 5)] for entry in entries],
+        dtype=float,
+    )
+    quantities = np.array([float(entry["quantity"]) for entry in entries])
+    return colors, quantities, colormap_type
+
+
+def colors_to_values(rgb, colors, quantities, colormap_type="ramp"):
+    """
+    Invert the colormap. For a ramp, project each pixel onto the nearest
+    segment between consecutive legend stops and interpolate its quantity.
+    Interval and value colormaps have no blending, so each pixel takes the
+    quantity of the nearest stop's color.
+    """
+    if colormap_type != "ramp" or len(quantities) == 1:
+        distance = ((rgb[:, None, :] - colors[None, :, :]) ** 2).sum(axis=2)
+        return quantities[distance.argmin(axis=1)]
+
+    start = colors[:-1]
+    segment = colors[1:] - start
+    length_sq = np.maximum((segment ** 2).sum(axis=1), 1e-9)
+
+    # Pixels along the first axis, segments along the second
+    offset = rgb[:, None, :] - start[None, :, :]
+    t = np.clip((offset * segment[None, :, :]).sum(axis=2) / length_sq, 0, 1)
+    distance = ((offset - t[:, :, None] * segment[None, :, :]) ** 2).sum(axis=2)
+
+    nearest = distance.argmin(axis=1)
+    rows = np.arange(len(rgb))
+    q_start = quantities[:-1][nearest]
+    q_end = quantities[1:][nearest]
+    return q_start + t[rows, nearest] * (q_end - q_start)
+
+
+def sample_tile(tile, bbox, lats, lons, colors, quantities, colormap_type="ramp"):
+    """Apparent temperature at each point, NaN where the tile has no data."""
+    height, width = tile.shape[:2]
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    cols = np.floor((lons - min_lon) / (max_lon - min_lon) * width).astype(int)
+    rows = np.floor((max_lat - lats) / (max_lat - min_lat) * height).astype(int)
+    cols = np.clip(cols, 0, width - 1)
+    rows = np.clip(rows, 0, height - 1)
+
+    pixels = tile[rows, cols]
+    values = colors_to_values(pixels[:, :3].astype(float), colors, quantities, colormap_type)
+    values[pixels[:, 3] == 0] = np.nan
+    return values
+
+
+if __name__ == "__main__":
+    points = load_points()
+    lats = points["latitude"].to_numpy()
+    lons = points["longitude"].to_numpy()
+
+    bbox = points_bbox(lats, lons)
+    valid_time = os.getenv("VALID_TIME") or fetch_valid_time(LAYER)
+
+    tile = fetch_tile(LAYER, valid_time, bbox)
+    colors, quantities, colormap_type = fetch_colormap(LAYER, valid_time)
+    prune_cache(LAYER, valid_time)
+
+    points["apparent_temperature"] = sample_tile(tile, bbox, lats, lons, colors, quantities, colormap_type).round(1)
+    points["valid_time"] = valid_time
+
+    points.to_csv(CSV_OUT, index=False)
+    points.to_json(JSON_OUT, indent=4, orient="records")
+    print(f"Sampled {points['apparent_temperature'].notna().sum()} of {len(points)} points for {valid_time}")
+
+    # Paths for S3 storage
+    S3_BUCKET = "stilesdata.com"
+    S3_CSV_KEY = f"weather/apparent_temperature_points.csv"
+    S3_JSON_KEY = f"weather/apparent_temperature_points.json"
+
+    # Initialize boto3 client with environment variables
+    s3_client = boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv("MY_AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("MY_AWS_SECRET_ACCESS_KEY"),
+        aws_session_token=os.getenv("MY_AWS_SESSION_TOKEN"),
+    )
+
+    # Upload the CSV file to S3
+    s3_client.upload_file(str(CSV_OUT), S3_BUCKET, S3_CSV_KEY)
+    print(f"CSV file uploaded to s3://{S3_BUCKET}/{S3_CSV_KEY}")
+
+    # Upload the JSON file
+    s3_client.upload_file(str(JSON_OUT), S3_BUCKET, S3_JSON_KEY)
+    print(f"JSON file uploaded to s3://{S3_BUCKET}/{S3_JSON_KEY}")
@@ -21,7 +21,7 @@ CSV_OUT = BASE / "../data/processed/latest_conditions_airports.csv"
 
 
 # Load locations from the config file
-with open("../data/reference/airports.json", "r") as f:
+with open(BASE / "../data/reference/airports.json", "r") as f:
     airports = json.load(f)
 
 
@@ -16,11 +16,12 @@ from pathlib import Path
 from xml.etree import ElementTree as ET
 
 # Determine the absolute paths for input and output files
-BASE = Path.cwd()
+# BASE = Path.cwd()
+BASE = Path(__file__).resolve().parent
 JSON_OUT = BASE / "../data/processed/current_conditions.json"
 
 # Load locations from the config file
-with open("../data/reference/socal_stations_daily.json", "r") as f:
+with open(BASE / "../data/reference/socal_stations_daily.json", "r") as f:
     locations = json.load(f)
 
 base_url = "https://forecast.weather.gov/MapClick.php?lat={}&lon={}&unit=0&lg=english&FcstType=dwml"
@@ -14,14 +14,19 @@ import pandas as pd
 import boto3
 from pathlib import Path
 from xml.etree import ElementTree as ET
+from forecast_changes import build_change_feed, commit_state
 
 # Determine the absolute paths for input and output files
-BASE = Path.cwd()
+# BASE = Path.cwd()
+BASE = Path(__file__).resolve().parent
 JSON_OUT = BASE / "../data/processed/seven_day_forecast_daily.json"
 CSV_OUT = BASE / "../data/processed/seven_day_forecast_daily.csv"
+CHANGES_OUT = BASE / "../data/processed/seven_day_forecast_daily_changes.json"
+SNAPSHOT_OUT = BASE / "../data/processed/seven_day_forecast_daily_snapshot.json"
+STATE_FILE = BASE / "../data/processed/seven_day_forecast_daily_state.json"
 
 # Load locations from the config file
-with open("../data/reference/socal_stations_daily.json", "r") as f:
+with open(BASE / "../data/reference/socal_stations_daily.json", "r") as f:
     locations = json.load(f)
 
 base_url = "https://forecast.weather.gov/MapClick.php?lat={}&lon={}&unit=0&lg=english&FcstType=dwml"
@@ -111,12 +116,17 @@ def parse_weather_data(xml_data, station_name):
     return parsed_data
 
 all_data = []
+sources = {}
+failed_stations = []
 
 for station_id, info in locations.items():
     xml_data = fetch_weather_data(info["latitude"], info["longitude"])
     if xml_data:
         weather_data = parse_weather_data(xml_data, info["station"])
         all_data.append(weather_data)
+        sources[station_id] = weather_data["location"]
+    else:
+        failed_stations.append(station_id)
 
 # Convert to JSON
 json_data = json.dumps(all_data, indent=2)
@@ -138,10 +148,25 @@ for location_data in all_data:
 df = pd.DataFrame(all_data_flat)
 df.to_csv(CSV_OUT, index=False)
 
+# Compare against the previous run and write the change feed
+# The issue time moves every run, so it isn't treated as a changed field
+delta, snapshot_written, feed_state = build_change_feed(
+    all_data_flat,
+    sources,
+    failed_stations,
+    STATE_FILE,
+    CHANGES_OUT,
+    SNAPSHOT_OUT,
+    ignore=("current_as_of",),
+)
+
 # Paths for S3 storage
 S3_BUCKET = "stilesdata.com"
 S3_CSV_KEY = f"weather/seven_day_forecast_daily.csv"
 S3_JSON_KEY = f"weather/seven_day_forecast_daily.json"
+S3_CHANGES_KEY = f"weather/changes/seven_day_forecast_daily_{delta['sequence']}.json"
+S3_CHANGES_LATEST_KEY = f"weather/changes/seven_day_forecast_daily_latest.json"
+S3_SNAPSHOT_KEY = f"weather/changes/seven_day_forecast_daily_snapshot.json"
 
 # Initialize boto3 client with environment variables
 s3_client = boto3.client(
@@ -157,4 +182,17 @@ print(f"CSV file uploaded to s3://{S3_BUCKET}/{S3_CSV_KEY}")
 
 # Upload the JSON file
 s3_client.upload_file(str(JSON_OUT), S3_BUCKET, S3_JSON_KEY)
-print(f"JSON file uploaded to s3://{S3_BUCKET}/{S3_JSON_KEY}")
\ No newline at end of file
+print(f"JSON file uploaded to s3://{S3_BUCKET}/{S3_JSON_KEY}")
+
+# Upload the change feed, keyed by sequence so clients can catch up
+s3_client.upload_file(str(CHANGES_OUT), S3_BUCKET, S3_CHANGES_KEY)
+s3_client.upload_file(str(CHANGES_OUT), S3_BUCKET, S3_CHANGES_LATEST_KEY)
+print(f"Change feed uploaded to s3://{S3_BUCKET}/{S3_CHANGES_KEY}")
+
+# Upload the full snapshot only when one was written this run
+if snapshot_written:
+    s3_client.upload_file(str(SNAPSHOT_OUT), S3_BUCKET, S3_SNAPSHOT_KEY)
+    print(f"Snapshot uploaded to s3://{S3_BUCKET}/{S3_SNAPSHOT_KEY}")
+
+# Only advance the feed once this run's delta is published
+commit_state(STATE_FILE, feed_state)
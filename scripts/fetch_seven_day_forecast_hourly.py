@@ -14,15 +14,20 @@ import requests
 import pandas as pd
 from pathlib import Path
 from xml.etree import ElementTree as ET
+from forecast_changes import build_change_feed, commit_state
 
 # Determine the absolute paths for input and output files
-BASE = Path.cwd()
+# BASE = Path.cwd()
+BASE = Path(__file__).resolve().parent
 JSON_OUT = BASE / "../data/processed/seven_day_forecast_hourly.json"
 CSV_OUT = BASE / "../data/processed/seven_day_forecast_hourly.csv"
+CHANGES_OUT = BASE / "../data/processed/seven_day_forecast_hourly_changes.json"
+SNAPSHOT_OUT = BASE / "../data/processed/seven_day_forecast_hourly_snapshot.json"
+STATE_FILE = BASE / "../data/processed/seven_day_forecast_hourly_state.json"
 
 
 # Load locations from the config file
-with open("../data/reference/socal_stations_daily.json", "r") as f:
+with open(BASE / "../data/reference/socal_stations_daily.json", "r") as f:
     locations = json.load(f)
 
 base_url = (
@@ -114,15 +119,18 @@ def parse_weather_data(xml_data, station_name):
 
 
 all_data = []
+sources = {}
+failed_stations = []
 
 for station_id, info in locations.items():
     xml_data = fetch_weather_data(info["latitude"], info["longitude"])
     if xml_data:
-        weather_data = parse_weather_data(
-            xml_data,
-            info["station"].title().replace("Ucla", "UCLA").replace("Lax", "LAX"),
-        )
+        station_name = info["station"].title().replace("Ucla", "UCLA").replace("Lax", "LAX")
+        weather_data = parse_weather_data(xml_data, station_name)
         all_data.extend(weather_data)
+        sources[station_id] = station_name.title()
+    else:
+        failed_stations.append(station_id)
 
 
 # Convert to DataFrame
@@ -133,11 +141,20 @@ df.to_csv(CSV_OUT, index=False)
 df.to_json(JSON_OUT, indent=4, orient="records")
 
 
+# Compare against the previous run and write the change feed
+delta, snapshot_written, feed_state = build_change_feed(
+    all_data, sources, failed_stations, STATE_FILE, CHANGES_OUT, SNAPSHOT_OUT
+)
+
+
 # S3
 # Paths for S3 storage
 S3_BUCKET = "stilesdata.com"
 S3_CSV_KEY = f"weather/seven_day_forecast_hourly.csv"
 S3_JSON_KEY = f"weather/seven_day_forecast_hourly.json"
+S3_CHANGES_KEY = f"weather/changes/seven_day_forecast_hourly_{delta['sequence']}.json"
+S3_CHANGES_LATEST_KEY = f"weather/changes/seven_day_forecast_hourly_latest.json"
+S3_SNAPSHOT_KEY = f"weather/changes/seven_day_forecast_hourly_snapshot.json"
 
 # Initialize boto3 client with environment variables
 s3_client = boto3.client(
@@ -153,4 +170,17 @@ print(f"CSV file uploaded to s3://{S3_BUCKET}/{S3_CSV_KEY}")
 
 # Upload the JSON file
 s3_client.upload_file(str(JSON_OUT), S3_BUCKET, S3_JSON_KEY)
-print(f"JSON file uploaded to s3://{S3_BUCKET}/{S3_JSON_KEY}")
\ No newline at end of file
+print(f"JSON file uploaded to s3://{S3_BUCKET}/{S3_JSON_KEY}")
+
+# Upload the change feed, keyed by sequence so clients can catch up
+s3_client.upload_file(str(CHANGES_OUT), S3_BUCKET, S3_CHANGES_KEY)
+s3_client.upload_file(str(CHANGES_OUT), S3_BUCKET, S3_CHANGES_LATEST_KEY)
+print(f"Change feed uploaded to s3://{S3_BUCKET}/{S3_CHANGES_KEY}")
+
+# Upload the full snapshot only when one was written this run
+if snapshot_written:
+    s3_client.upload_file(str(SNAPSHOT_OUT), S3_BUCKET, S3_SNAPSHOT_KEY)
+    print(f"Snapshot uploaded to s3://{S3_BUCKET}/{S3_SNAPSHOT_KEY}")
+
+# Only advance the feed once this run's delta is published
+commit_state(STATE_FILE, feed_state)
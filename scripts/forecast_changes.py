@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Incremental change feed for the seven-day forecasts
+# Keeps the previous run's rows keyed by (location, time) and writes a compact
+# delta listing added, removed and changed fields, with a sequence number so
+# clients can apply patches in order. A full snapshot is only written on the
+# first run and then every SNAPSHOT_EVERY runs.
+
+import json
+from datetime import datetime, timezone
+
+KEY_FIELDS = ("location", "time")
+
+# Hourly runs go out every hour, so this is roughly one snapshot a day
+SNAPSHOT_EVERY = 24
+
+# Runs a failed or dropped station's rows are carried forward before they're
+# reported as removed
+CARRY_RUNS = 3
+
+
+def index_rows(rows, ignore=()):
+    """Key flat forecast rows by (location, time), dropping ignored fields."""
+    indexed = {}
+    for row in rows:
+        key = tuple(row[field] for field in KEY_FIELDS)
+        indexed[key] = {
+            field: value
+            for field, value in row.items()
+            if field not in KEY_FIELDS and field not in ignore
+        }
+    return indexed
+
+
+def diff_rows(previous, current):
+    """Compare two indexed forecasts and return added, removed and changed rows."""
+    added = []
+    removed = []
+    changed = []
+
+    for key, fields in current.items():
+        location, time = key
+        if key not in previous:
+            added.append({"location": location, "time": time, "fields": fields})
+            continue
+        old_fields = previous[key]
+        updates = {}
+        for field in list(fields) + [f for f in old_fields if f not in fields]:
+            old_value = old_fields.get(field)
+            new_value = fields.get(field)
+            if old_value != new_value:
+                updates[field] = {"from": old_value, "to": new_value}
+        if updates:
+            changed.append({"location": location, "time": time, "fields": updates})
+
+    for key in previous:
+        if key not in current:
+            location, time = key
+            removed.append({"location": location, "time": time})
+
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def load_state(state_path):
+    """Load the previous run's sequence number and rows, if any."""
+    if not state_path.exists():
+        return None
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def build_change_feed(rows, sources, failed, state_path, delta_path, snapshot_path, ignore=(), snapshot_every=SNAPSHOT_EVERY, carry_runs=CARRY_RUNS):
+    """
+    Diff this run's rows against the stored state and write the delta and,
+    when one is due, a full snapshot. Returns the delta, whether a snapshot
+    was written and the new state. The state isn't saved here: pass it to
+    commit_state once the delta (and snapshot) have been published, so a
+    failed upload doesn't leave a gap in the sequence.
+
+    sources maps each station fetched this run to its location name. Rows
+    for stations in failed, or missing from sources after being there last
+    run, are carried forward from the previous run for up to CARRY_RUNS
+    runs rather than reported as removed.
+    """
+    state = load_state(state_path)
+    current = index_rows(rows, ignore)
+
+    if state is None:
+        sequence = 1
+        previous = {}
+        previous_sources = {}
+        missing_runs = {}
+        snapshot_sequence = None
+    else:
+        sequence = state["sequence"] + 1
+        previous = index_rows(state["rows"])
+        previous_sources = state.get("sources", {})
+        missing_runs = state.get("missing_runs", {})
+        snapshot_sequence = state["snapshot_sequence"]
+
+    missing = (set(failed) | set(previous_sources)) - set(sources)
+    missing_runs = {
+        station_id: missing_runs.get(station_id, 0) + 1
+        for station_id in missing
+        if station_id in previous_sources
+    }
+    carried = {
+        station_id: previous_sources[station_id]
+        for station_id, runs in missing_runs.items()
+        if runs <= carry_runs
+    }
+    missing_runs = {station_id: missing_runs[station_id] for station_id in carried}
+    carried_locations = set(carried.values())
+    for key, fields in previous.items():
+        if key[0] in carried_locations:
+            current.setdefault(key, fields)
+    sources = {**carried, **sources}
+
+    generated = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    delta = {"sequence": sequence, "previous_sequence": sequence - 1, "generated": generated}
+    delta.update(diff_rows(previous, current))
+
+    with open(delta_path, "w") as f:
+        json.dump(delta, f, indent=2)
+
+    snapshot_due = snapshot_sequence is None or sequence - snapshot_sequence >= snapshot_every
+    current_rows = [
+        dict(zip(KEY_FIELDS, key), **fields) for key, fields in current.items()
+    ]
+
+    if snapshot_due:
+        snapshot_sequence = sequence
+        snapshot = {"sequence": sequence, "generated": generated, "rows": current_rows}
+        with open(snapshot_path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+
+    print(
+        f"Change feed #{sequence}: {len(delta['added'])} added, "
+        f"{len(delta['removed'])} removed, {len(delta['changed'])} changed"
+    )
+    if carried:
+        print(f"Carried forward previous rows for {len(carried)} missing stations")
+    new_state = {
+        "sequence": sequence,
+        "snapshot_sequence": snapshot_sequence,
+        "sources": sources,
+        "missing_runs": missing_runs,
+        "rows": current_rows,
+    }
+    return delta, snapshot_due, new_state
+
+
+def commit_state(state_path, state):
+    """Save the state from build_change_feed so the next run diffs against it."""
+    temp_path = state_path.with_suffix(".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    temp_path.replace(state_path)
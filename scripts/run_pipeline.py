@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Run the fetch scripts as one incremental pipeline
+# Each script is a stage with declared inputs and outputs. A stage's inputs
+# (reference files, upstream response validators and, for live feeds, the
+# current refresh window) are fingerprinted and the stage is skipped when the
+# fingerprint matches its last successful run. Stages that don't depend on
+# each other run in parallel in this process.
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import requests
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Determine the absolute paths for input and output files
+BASE = Path(__file__).resolve().parent
+DATA = BASE / "../data"
+STATE_FILE = DATA / "processed/pipeline_state.json"
+
+# HEAD requests to make at once when checking a stage's upstream validators
+UPSTREAM_WORKERS = 8
+
+normals_urls = {
+    "hourly": "https://www.ncei.noaa.gov/data/normals-hourly/2006-2020/access/{}.csv",
+    "daily": "https://www.ncei.noaa.gov/data/normals-daily/2006-2020/access/{}.csv",
+}
+
+
+def stations_upstream():
+    """Normals CSVs for every candidate station the validator checks."""
+    with open(DATA / "reference/socal_stations.json", "r") as f:
+        station_ids = list(json.load(f))
+    return [url.format(station_id) for url in normals_urls.values() for station_id in station_ids]
+
+
+def normals_upstream():
+    """Normals CSV for every station the normals script will download."""
+    urls = []
+    for frequency, url in normals_urls.items():
+        with open(DATA / f"reference/socal_stations_{frequency}.json", "r") as f:
+            urls.extend(url.format(station_id) for station_id in json.load(f))
+    return urls
+
+
+# Stages are ordered by their inputs and outputs: a stage that reads another
+# stage's output runs after it. "modules" are helpers the script imports from
+# this directory, hashed along with the script. "every" is the refresh window,
+# in minutes, for live feeds whose upstream changes without a validator we can
+# check. Stages marked "manual" only run when named, so the scheduled run reads
+# their outputs as they are instead of waiting on them.
+stages = {
+    "validate_stations": {
+        "script": "archive/test_stations_normals_data.py",
+        "inputs": ["reference/socal_stations.json"],
+        "outputs": ["reference/socal_stations_hourly.json", "reference/socal_stations_daily.json"],
+        "upstream": stations_upstream,
+        "manual": True,
+    },
+    "climate_normals": {
+        "script": "fetch_climate_normals.py",
+        "inputs": ["reference/socal_stations_hourly.json", "reference/socal_stations_daily.json"],
+        "outputs": [
+            "processed/daily_normals.json",
+            "processed/hourly_normals.json",
+            "reference/valid_hourly_stations.json",
+            "reference/valid_daily_stations.json",
+        ],
+        "upstream": normals_upstream,
+    },
+    "current_airports": {
+        "script": "fetch_current_airports.py",
+        "inputs": ["reference/airports.json"],
+        "outputs": ["processed/latest_conditions_airports.json"],
+        "every": 60,
+    },
+    "forecast_hourly": {
+        "script": "fetch_seven_day_forecast_hourly.py",
+        "inputs": ["reference/socal_stations_daily.json"],
+        "outputs": ["processed/seven_day_forecast_hourly.json"],
+        "modules": ["forecast_changes.py"],
+        "every": 60,
+    },
+    "forecast_daily": {
+        "script": "fetch_seven_day_forecast_daily.py",
+        "inputs": ["reference/socal_stations_daily.json"],
+        "outputs": ["processed/seven_day_forecast_daily.json"],
+        "modules": ["forecast_changes.py"],
+        "every": 60,
+    },
+    "apparent_temperature": {
+        "script": "fetch_apparent_temp_raster.py",
+        "inputs": ["reference/socal_stations_daily.json", "reference/locations.json"],
+        "outputs": ["processed/apparent_temperature_points.json"],
+        "every": 60,
+    },
+}
+
+
+def file_hash(path):
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def upstream_validator(url):
+    """ETag or Last-Modified for an upstream URL, without downloading the body."""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=30)
+    except requests.RequestException:
+        return None
+    return (
+        response.headers.get("ETag")
+        or response.headers.get("Last-Modified")
+        or response.headers.get("Content-Length")
+    )
+
+
+def fingerprint(name, now):
+    """Hash of everything a stage reads: its code, input files, upstream validators and refresh window."""
+    stage = stages[name]
+    parts = {
+        "script": file_hash(BASE / stage["script"]),
+        "modules": {path: file_hash(BASE / path) for path in stage.get("modules", [])},
+        "inputs": {path: file_hash(DATA / path) for path in stage["inputs"]},
+    }
+    if "upstream" in stage:
+        urls = stage["upstream"]()
+        with ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS) as executor:
+            parts["upstream"] = dict(zip(urls, executor.map(upstream_validator, urls)))
+    if "every" in stage:
+        parts["window"] = int(now // (stage["every"] * 60))
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def dependencies(name):
+    """Stages whose outputs this stage reads."""
+    inputs = set(stages[name]["inputs"])
+    return {
+        other
+        for other, stage in stages.items()
+        if other != name and inputs & set(stage["outputs"])
+    }
+
+
+def run_stage(name, previous, now, force=False):
+    """
+    Fingerprint a stage and, if it's stale, execute its script as __main__ in
+    its own namespace. Unlike runpy.run_path, this leaves sys.argv and
+    sys.modules["__main__"] alone, so stages running in parallel threads can't
+    see each other's globals. Returns the fingerprint and whether it ran.
+    """
+    # Fingerprinting can mean many HEAD requests, so it runs here on a worker
+    # thread rather than holding up the scheduler
+    current = fingerprint(name, now)
+    outputs_exist = all((DATA / path).exists() for path in stages[name]["outputs"])
+    if not force and outputs_exist and previous == current:
+        print(f"Skipping {name}: inputs unchanged")
+        return current, False
+
+    print(f"Running {name}")
+    path = BASE / stages[name]["script"]
+    code = compile(path.read_bytes(), str(path), "exec")
+    exec(code, {"__name__": "__main__", "__file__": str(path), "__builtins__": __builtins__})
+    return current, True
+
+
+def run_pipeline(selected=None, force=False, workers=4):
+    """Run stale stages in dependency order, returning the names of any that failed."""
+    names = list(selected or [name for name, stage in stages.items() if not stage.get("manual")])
+    state = json.loads(STATE_FILE.read_text()) if STATE_FILE.exists() else {}
+    now = time.time()
+
+    pending = {name: dependencies(name) & set(names) for name in names}
+    failed = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, deps in list(pending.items()):
+                if deps & failed:
+                    print(f"Skipping {name}: an upstream stage failed")
+                    failed.add(name)
+                    del pending[name]
+                    continue
+                if deps & (set(pending) | set(running.values())):
+                    continue
+                del pending[name]
+
+                # Submitted only once upstream stages have written their outputs
+                future = executor.submit(run_stage, name, state.get(name), now, force)
+                running[future] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    state[name], _ = future.result()
+                except (Exception, SystemExit) as e:
+                    print(f"Stage {name} failed: {e}")
+                    failed.add(name)
+                    state.pop(name, None)
+
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f, indent=4)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run stale pipeline stages.")
+    parser.add_argument("stages", nargs="*", help=f"Stages to run (default: all but manual ones, of {', '.join(stages)})")
+    parser.add_argument("--force", action="store_true", help="Run stages even if their inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=4, help="Stages to run at once")
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(stages)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    failed = run_pipeline(args.stages, args.force, args.workers)
+    if failed:
+        print(f"Failed stages: {', '.join(sorted(failed))}")
+        sys.exit(1)